@@ -1,5 +1,167 @@
-import google.generativeai as genai
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
 import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.generativeai.client import FileServiceClient
+from google.generativeai.types import file_types
+from google.api_core import exceptions as google_exceptions
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Bump whenever SYSTEM_PROMPT or the expected output shape changes,
+# so cached results from the old prompt are no longer served.
+PROMPT_VERSION = 3
+
+# Output shape the model is constrained to, mirroring the example in SYSTEM_PROMPT.
+# Prices and descriptions are nullable because rule 1 forbids guessing them.
+_NAMED_LIST = {"type": "array", "items": {"type": "string"}}
+MENU_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "number": {"type": "integer"},
+                    "name": {"type": "string"},
+                    "price": {"type": "number", "nullable": True},
+                    "description": {"type": "string", "nullable": True},
+                    "modifiers": _NAMED_LIST,
+                },
+                "required": ["name"],
+            },
+        },
+        "submenus": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "number": {"type": "integer"},
+                    "name": {"type": "string"},
+                    "items": _NAMED_LIST,
+                },
+                "required": ["name", "items"],
+            },
+        },
+        "modifier_groups": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "number": {"type": "integer"},
+                    "name": {"type": "string"},
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "price": {"type": "number", "nullable": True},
+                            },
+                            "required": ["name"],
+                        },
+                    },
+                },
+                "required": ["name", "items"],
+            },
+        },
+    },
+    "required": ["items", "submenus", "modifier_groups"],
+}
+
+MENU_CONFIG = {"response_mime_type": "application/json", "response_schema": MENU_SCHEMA}
+
+# analyze_texts_bulk wraps one extraction per menu in {"results": [...]}
+BULK_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": MENU_SCHEMA}},
+        "required": ["results"],
+    },
+}
+
+# Rate limits and transient server/network failures; worth retrying with backoff
+_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Upper bound on combined input for analyze_texts_bulk, at roughly 4 characters
+# per token this keeps a packed request well inside a 1M-token context.
+BULK_MAX_CHARS = 400_000
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache")
+CACHE_MAX_ENTRIES = 128
+
+# cache key -> raw JSON bytes, shared across Streamlit sessions in this process
+_memory_cache = OrderedDict()
+
+# (api key hash, content digest) -> Gemini File API name of an earlier upload
+_uploaded_files = {}
+
+# Both caches are used from executor threads and asyncio.to_thread at once
+_cache_lock = threading.Lock()
+
+# genai.configure() swaps the SDK's process-wide clients, so two sessions with
+# different keys on the shared executor could send requests under each other's
+# key. Each key gets its own clients instead; they are safe to share across threads.
+@functools.lru_cache(maxsize=8)
+def _key_clients(api_key: str):
+    options = {"api_key": api_key}
+    return glm.GenerativeServiceClient(client_options=options), FileServiceClient(client_options=options)
+
+@functools.lru_cache(maxsize=8)
+def _cached_model(api_key: str, model_name: str, system_instruction: str):
+    model = genai.GenerativeModel(model_name, system_instruction=system_instruction, generation_config=MENU_CONFIG)
+    # GenerativeModel takes no client argument and falls back to the global one
+    # when _client is unset, so bind it to this key's client up front
+    model._client = _key_clients(api_key)[0]
+    return model
+
+class AsyncRateLimiter:
+    """
+    Allows at most `max_rate` acquisitions per `period` seconds (sliding window).
+    Keeps concurrent batches under a model's requests-per-minute limit instead
+    of bursting into 429s. Create it inside the event loop that uses it.
+    """
+
+    def __init__(self, max_rate: int, period: float = 60.0):
+        self.max_rate = max_rate
+        self.period = period
+        self._times = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until another request fits in the window, then record it."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            while self._times and now - self._times[0] >= self.period:
+                self._times.popleft()
+            if len(self._times) >= self.max_rate:
+                await asyncio.sleep(self._times[0] + self.period - now)
+                self._times.popleft()
+            self._times.append(loop.time())
 
 class AIService:
     """
@@ -54,48 +216,575 @@ class AIService:
         """
         Analyze a file (Image or PDF) and return structured data.
         """
-        return self._call_gemini_file(file_path, mime_type, api_key, model_name)
+        digest = self._file_digest(file_path)
+        cache_key = self._cache_key(digest, model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = self._call_gemini_file(file_path, mime_type, api_key, model_name, digest)
+        self._cache_put(cache_key, result)
+        return result
+
+    def analyze_bytes(self, data: bytes, mime_type: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash") -> dict:
+        """
+        Like analyze_file, for content already in memory (e.g. a Streamlit upload).
+        """
+        digest = self._content_digest(data)
+        cache_key = self._cache_key(digest, model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = self._call_gemini_file(data, mime_type, api_key, model_name, digest)
+        self._cache_put(cache_key, result)
+        return result
 
     def analyze_text(self, text: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash") -> dict:
         """
         Analyze text content (from scraping).
         """
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        inputs = [self.SYSTEM_PROMPT, f"Analyze the following menu text:\n\n{text}"]
-        return self._generate_with_retry(model, inputs)
+        cache_key = self._cache_key(self._content_digest(self._normalize_text(text).encode()), model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
-    def _call_gemini_file(self, file_path: str, mime_type: str, api_key: str, model_name: str) -> dict:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
+        model = self._get_model(api_key, model_name)
+        inputs = [f"Analyze the following menu text:\n\n{text}"]
+        result = self._generate_with_retry(model, inputs)
+        self._cache_put(cache_key, result)
+        return result
+
+    def analyze_texts_bulk(self, texts: list, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash") -> list:
+        """
+        Analyze several menu texts with a single request, to save requests
+        per minute on rate-limited tiers.
+
+        Returns one result dict per input text, in the same order.
+        Texts already in the cache are not sent again.
+        """
+        cache_keys = [self._cache_key(self._content_digest(self._normalize_text(t).encode()), model_name) for t in texts]
+        results = [self._cache_get(key) for key in cache_keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        # Too large to pack into one request; fall back to one request per text
+        if sum(len(texts[i]) for i in pending) > BULK_MAX_CHARS:
+            for i in pending:
+                results[i] = self.analyze_text(texts[i], api_key, provider=provider, model_name=model_name)
+            return results
+
+        menus = "\n\n".join(f"--- MENU {n} ---\n{texts[i]}" for n, i in enumerate(pending))
+        instructions = (
+            f"You will receive {len(pending)} menus, each starting with a '--- MENU n ---' marker.\n"
+            'Return a JSON object {"results": [...]} where element n is the extraction for MENU n, '
+            "in the format described above."
+        )
+
+        model = self._get_model(api_key, model_name)
+        inputs = [instructions, menus]
+        data = self._generate_with_retry(model, inputs, generation_config=BULK_CONFIG)
+
+        packed = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(packed, list) or len(packed) != len(pending):
+            error = data.get("error") if isinstance(data, dict) and "error" in data else "Model returned the wrong number of results"
+            for i in pending:
+                results[i] = {"error": error}
+            return results
+
+        for i, result in zip(pending, packed):
+            results[i] = result
+            self._cache_put(cache_keys[i], result)
+        return results
+
+    def _call_gemini_file(self, source, mime_type: str, api_key: str, model_name: str, digest: str) -> dict:
+        model = self._get_model(api_key, model_name)
         
-        uploaded_file = genai.upload_file(file_path, mime_type=mime_type)
-        inputs = [self.SYSTEM_PROMPT, uploaded_file]
+        uploaded_file = self._upload_file(source, mime_type, api_key, digest)
+        inputs = [uploaded_file]
         return self._generate_with_retry(model, inputs)
 
-    def _generate_with_retry(self, model, inputs, max_retries=3):
-        import time
-        import random
-        
+    async def async_analyze_file(self, file_path: str, mime_type: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash", limiter: AsyncRateLimiter = None, model=None) -> dict:
+        """
+        Async variant of analyze_file, so several files can be in flight at once.
+        If a limiter is given, every model request (including retries) waits on it.
+        A model from _async_model can be passed in to share its connection across calls.
+        """
+        # Hashing, cache lookups and the upload all touch disk or network; keep them off the event loop
+        digest = await asyncio.to_thread(self._file_digest, file_path)
+        cache_key = self._cache_key(digest, model_name)
+        cached = await asyncio.to_thread(self._cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+        uploaded_file = await asyncio.to_thread(self._upload_file, file_path, mime_type, api_key, digest)
+        inputs = [uploaded_file]
+        async with self._async_model(api_key, model_name, model) as model:
+            result = await self._generate_with_retry_async(model, inputs, limiter=limiter)
+        await asyncio.to_thread(self._cache_put, cache_key, result)
+        return result
+
+    async def async_analyze_bytes(self, data: bytes, mime_type: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash", limiter: AsyncRateLimiter = None, model=None) -> dict:
+        """
+        Async variant of analyze_bytes.
+        """
+        digest = self._content_digest(data)
+        cache_key = self._cache_key(digest, model_name)
+        cached = await asyncio.to_thread(self._cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+        uploaded_file = await asyncio.to_thread(self._upload_file, data, mime_type, api_key, digest)
+        inputs = [uploaded_file]
+        async with self._async_model(api_key, model_name, model) as model:
+            result = await self._generate_with_retry_async(model, inputs, limiter=limiter)
+        await asyncio.to_thread(self._cache_put, cache_key, result)
+        return result
+
+    async def async_analyze_text(self, text: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash", limiter: AsyncRateLimiter = None, model=None) -> dict:
+        """
+        Async variant of analyze_text.
+        """
+        cache_key = self._cache_key(self._content_digest(self._normalize_text(text).encode()), model_name)
+        cached = await asyncio.to_thread(self._cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+        inputs = [f"Analyze the following menu text:\n\n{text}"]
+        async with self._async_model(api_key, model_name, model) as model:
+            result = await self._generate_with_retry_async(model, inputs, limiter=limiter)
+        await asyncio.to_thread(self._cache_put, cache_key, result)
+        return result
+
+    async def batch_analyze(self, files: list, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash", max_concurrency: int = 10, rpm: int = None) -> list:
+        """
+        Analyze many files concurrently.
+
+        Args:
+            files: list of (file_path, mime_type) tuples; the file may also be given as bytes
+            max_concurrency: maximum number of requests in flight at once
+            rpm: optional requests-per-minute cap for the model
+
+        Returns:
+            list of result dicts, in the same order as `files`
+        """
+        sem = asyncio.Semaphore(max_concurrency)
+        limiter = AsyncRateLimiter(rpm) if rpm else None
+
+        async def run(source, mime_type):
+            analyze = self.async_analyze_bytes if isinstance(source, bytes) else self.async_analyze_file
+            async with sem:
+                try:
+                    return await analyze(source, mime_type, api_key, provider=provider, model_name=model_name, limiter=limiter, model=model)
+                except Exception as e:
+                    return {"error": str(e)}
+
+        async with self._async_model(api_key, model_name) as model:
+            return await asyncio.gather(*(run(source, mime) for source, mime in files))
+
+    async def batch_analyze_texts(self, texts: list, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash", max_concurrency: int = 10, rpm: int = None) -> list:
+        """
+        Analyze many texts concurrently, e.g. the chunks of a long scraped page.
+        Same options as batch_analyze; returns one result dict per text, in order.
+        """
+        sem = asyncio.Semaphore(max_concurrency)
+        limiter = AsyncRateLimiter(rpm) if rpm else None
+
+        async def run(text):
+            async with sem:
+                try:
+                    return await self.async_analyze_text(text, api_key, provider=provider, model_name=model_name, limiter=limiter, model=model)
+                except Exception as e:
+                    return {"error": str(e)}
+
+        async with self._async_model(api_key, model_name) as model:
+            return await asyncio.gather(*(run(text) for text in texts))
+
+    def merge_results(self, results: list) -> dict:
+        """
+        Merge several extraction results (e.g. one per PDF page) into one.
+
+        Items, submenus and modifier groups are de-duplicated by name
+        (case-insensitive); submenus and modifier groups that appear in
+        several results get their item lists combined. Everything is then
+        renumbered into the 100+/200+/10000+ ranges the prompt asks for.
+        Failed results are skipped; if all failed, the first error is returned.
+        """
+        merged = {"items": [], "submenus": [], "modifier_groups": []}
+        seen = {"items": {}, "submenus": {}, "modifier_groups": {}}
+        errors = []
+
+        for result in results:
+            if "error" in result:
+                errors.append(result["error"])
+                continue
+            if result.get("partial"):
+                merged["partial"] = True
+
+            for key in ("items", "submenus", "modifier_groups"):
+                for entry in result.get(key) or []:
+                    name = str(entry.get("name") or "").strip().lower()
+                    if not name:
+                        continue
+                    existing = seen[key].get(name)
+                    if existing is None:
+                        seen[key][name] = entry
+                        merged[key].append(entry)
+                    elif key == "submenus":
+                        existing_items = existing.setdefault("items", [])
+                        existing_items.extend(n for n in entry.get("items") or [] if n not in existing_items)
+                    elif key == "modifier_groups":
+                        existing_items = existing.setdefault("items", [])
+                        existing_names = {str(m.get("name") or "").strip().lower() for m in existing_items}
+                        existing_items.extend(m for m in entry.get("items") or []
+                                              if str(m.get("name") or "").strip().lower() not in existing_names)
+
+        if errors:
+            if not any(merged.values()):
+                return {"error": errors[0]}
+            # Some pages failed; keep what the others produced
+            merged["partial"] = True
+
+        for start, key in ((100, "items"), (200, "submenus"), (10000, "modifier_groups")):
+            for idx, entry in enumerate(merged[key]):
+                entry["number"] = start + idx
+
+        return merged
+
+    def stream_analyze_file(self, file_path: str, mime_type: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash"):
+        """
+        Like analyze_file, but yields the raw response text as it is generated.
+        Join the chunks and pass them to parse_response() for the structured data.
+        """
+        digest = self._file_digest(file_path)
+        cache_key = self._cache_key(digest, model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield json.dumps(cached)
+            return
+
+        model = self._get_model(api_key, model_name)
+
+        uploaded_file = self._upload_file(file_path, mime_type, api_key, digest)
+        inputs = [uploaded_file]
+        yield from self._stream_with_retry(model, inputs, cache_key)
+
+    def stream_analyze_bytes(self, data: bytes, mime_type: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash"):
+        """
+        Like stream_analyze_file, for content already in memory.
+        """
+        digest = self._content_digest(data)
+        cache_key = self._cache_key(digest, model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield json.dumps(cached)
+            return
+
+        model = self._get_model(api_key, model_name)
+
+        uploaded_file = self._upload_file(data, mime_type, api_key, digest)
+        inputs = [uploaded_file]
+        yield from self._stream_with_retry(model, inputs, cache_key)
+
+    def stream_analyze_text(self, text: str, api_key: str, provider: str = "gemini", model_name: str = "gemini-2.5-flash"):
+        """
+        Like analyze_text, but yields the raw response text as it is generated.
+        """
+        cache_key = self._cache_key(self._content_digest(self._normalize_text(text).encode()), model_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield json.dumps(cached)
+            return
+
+        model = self._get_model(api_key, model_name)
+        inputs = [f"Analyze the following menu text:\n\n{text}"]
+        yield from self._stream_with_retry(model, inputs, cache_key)
+
+    def parse_response(self, text: str) -> dict:
+        """
+        Parse raw model output, e.g. the joined chunks of a stream_analyze_* call.
+        Returns an {"error": ...} dict if the output is not valid JSON.
+        """
+        try:
+            return self._parse_response_text(text)
+        except ValueError as e:
+            return {"error": f"Could not parse model output: {e}"}
+
+    def _get_model(self, api_key: str, model_name: str):
+        """
+        Return a GenerativeModel for this key, reusing one created earlier.
+        The model keeps its key's API client (and open connections) between calls.
+
+        SYSTEM_PROMPT goes in as the system instruction, so every request starts
+        with the same prefix and Gemini can serve it from its implicit cache.
+        """
+        return _cached_model(api_key, model_name, self.SYSTEM_PROMPT)
+
+    @contextlib.asynccontextmanager
+    async def _async_model(self, api_key: str, model_name: str, model=None):
+        """
+        Yield `model` if one is given, else a fresh GenerativeModel whose async
+        client is closed on exit. The grpc.aio channel behind an async client is
+        bound to the event loop it was created in, and app.py runs each job in
+        its own asyncio.run(), so unlike _get_model these are never cached.
+        """
+        if model is not None:
+            yield model
+            return
+        model = genai.GenerativeModel(model_name, system_instruction=self.SYSTEM_PROMPT, generation_config=MENU_CONFIG)
+        async with glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key}) as client:
+            model._async_client = client
+            yield model
+
+    def _upload_file(self, source, mime_type: str, api_key: str, digest: str):
+        """
+        Upload a file (path or bytes) to the Gemini File API, reusing an earlier
+        upload of the same content under the same key. Gemini keeps uploads for 48h.
+        """
+        file_client = _key_clients(api_key)[1]
+        upload_key = (hashlib.sha256(api_key.encode()).hexdigest(), digest)
+        with _cache_lock:
+            name = _uploaded_files.get(upload_key)
+        if name:
+            try:
+                return file_types.File(file_client.get_file(name=name))
+            except Exception:
+                # Expired or deleted on the server; upload again
+                with _cache_lock:
+                    _uploaded_files.pop(upload_key, None)
+
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+            display_name = None
+        else:
+            display_name = os.path.basename(source)
+        uploaded_file = file_types.File(file_client.create_file(source, mime_type=mime_type, display_name=display_name))
+        with _cache_lock:
+            _uploaded_files[upload_key] = uploaded_file.name
+        return uploaded_file
+
+    def _content_digest(self, content: bytes) -> str:
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def _file_digest(self, file_path: str) -> str:
+        # Same digest as _content_digest, without holding the whole file in memory
+        h = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _cache_key(self, digest: str, model_name: str) -> str:
+        return f"{digest}-{model_name}-v{PROMPT_VERSION}"
+
+    def _normalize_text(self, text: str) -> str:
+        """
+        Collapse whitespace so re-scrapes of the same page that only differ
+        in layout/indentation share a cache entry.
+        """
+        return " ".join(text.split())
+
+    def _cache_get(self, key: str):
+        """
+        Return a cached result for `key`, or None on a miss.
+        Checks the in-process LRU first, then the on-disk cache.
+        """
+        with _cache_lock:
+            raw = _memory_cache.get(key)
+            if raw is not None:
+                _memory_cache.move_to_end(key)
+        if raw is not None:
+            return loads(raw)
+
+        try:
+            with open(os.path.join(CACHE_DIR, f"{key}.json"), "rb") as f:
+                raw = f.read()
+            result = loads(raw)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, raw)
+        return result
+
+    def _cache_put(self, key: str, result: dict):
+        # Never cache failures or truncated output; the next attempt should hit the API again
+        if not isinstance(result, dict) or "error" in result or result.get("partial"):
+            return
+
+        raw = json.dumps(result).encode()
+        self._remember(key, raw)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(os.path.join(CACHE_DIR, f"{key}.json"), "wb") as f:
+                f.write(raw)
+        except OSError as e:
+            print(f"Could not write cache entry: {e}")
+
+    def _remember(self, key: str, raw: bytes):
+        with _cache_lock:
+            _memory_cache[key] = raw
+            _memory_cache.move_to_end(key)
+            while len(_memory_cache) > CACHE_MAX_ENTRIES:
+                _memory_cache.popitem(last=False)
+
+    def _parse_response_text(self, text: str) -> dict:
+        # Models still occasionally wrap the JSON in a markdown fence despite the
+        # response schema; the closing fence is missing if the output was cut off
+        text = text.strip()
+        if text.startswith("```"):
+            text = text[3:]
+            if text.startswith("json"):
+                text = text[4:]
+        if text.endswith("```"):
+            text = text[:-3]
+        try:
+            return loads(text)
+        except ValueError:
+            # Output cut off mid-stream or at the token limit; keep what arrived intact
+            partial = self._salvage_partial(text)
+            if partial is None:
+                raise
+            return partial
+
+    def _salvage_partial(self, text: str):
+        """
+        Walk a truncated top-level JSON object key by key and keep every
+        complete value. For the array being written when the output stopped,
+        keep the elements that were finished.
+
+        Returns the recovered dict with "partial": True, or None if nothing
+        useful could be recovered.
+        """
+        decoder = json.JSONDecoder()
+
+        def skip(pos, chars=" \t\r\n,"):
+            while pos < len(text) and text[pos] in chars:
+                pos += 1
+            return pos
+
+        pos = text.find("{")
+        if pos == -1:
+            return None
+        pos += 1
+
+        result = {}
+        while True:
+            pos = skip(pos)
+            if pos >= len(text) or text[pos] == "}":
+                break
+            try:
+                key, pos = decoder.raw_decode(text, pos)
+            except ValueError:
+                break
+            pos = skip(pos, " \t\r\n")
+            if pos >= len(text) or text[pos] != ":":
+                break
+            pos = skip(pos + 1, " \t\r\n")
+
+            try:
+                result[key], pos = decoder.raw_decode(text, pos)
+                continue
+            except ValueError:
+                pass
+
+            if pos < len(text) and text[pos] == "[":
+                values = []
+                pos += 1
+                while True:
+                    pos = skip(pos)
+                    try:
+                        value, pos = decoder.raw_decode(text, pos)
+                    except ValueError:
+                        break
+                    values.append(value)
+                result[key] = values
+            break
+
+        # A cut-off array keeps whatever elements decoded (e.g. "items": [1, 2);
+        # ExcelBuilder only handles entries that are objects
+        for k in ("items", "submenus", "modifier_groups"):
+            if k in result:
+                entries = result[k]
+                result[k] = [e for e in entries if isinstance(e, dict)] if isinstance(entries, list) else []
+
+        if not any(result.get(k) for k in ("items", "submenus", "modifier_groups")):
+            return None
+        result["partial"] = True
+        return result
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, _RETRYABLE_ERRORS):
+            return True
+        # Errors re-raised without their API type still carry the status in the message
+        error_str = str(error)
+        return "429" in error_str or "503" in error_str or "quota" in error_str.lower()
+
+    def _generate_with_retry(self, model, inputs, max_retries=3, generation_config=None):
         for attempt in range(max_retries):
             try:
-                response = model.generate_content(inputs)
-                text = response.text
-                
-                if "```json" in text:
-                    text = text.split("```json")[1].split("```")[0]
-                elif "```" in text:
-                    text = text.split("```")[1].split("```")[0]
-                    
-                return json.loads(text)
+                response = model.generate_content(inputs, generation_config=generation_config)
             except Exception as e:
-                error_str = str(e)
-                if "429" in error_str or "quota" in error_str.lower():
+                if self._is_retryable(e):
                     if attempt < max_retries - 1:
                         sleep_time = (2 ** attempt) + random.uniform(0, 1)
-                        print(f"Rate limited. Retrying in {sleep_time:.2f}s...")
+                        print(f"Transient error ({e}). Retrying in {sleep_time:.2f}s...")
                         time.sleep(sleep_time)
                         continue
                 print(f"Gemini Error (Attempt {attempt+1}): {e}")
-                if attempt == max_retries - 1:
-                    return {"error": f"Failed after {max_retries} attempts: {str(e)}"}
+                return {"error": f"Failed after {attempt+1} attempts: {str(e)}"}
+            try:
+                text = response.text
+            except ValueError as e:
+                # Blocked by a safety filter or no candidate returned; there is no text to parse
+                return {"error": f"Model returned no text: {e}"}
+            # The response schema constrains the output, so asking again would not fix a bad parse
+            return self.parse_response(text)
+
+    def _stream_with_retry(self, model, inputs, cache_key, max_retries=3):
+        for attempt in range(max_retries):
+            chunks = []
+            try:
+                for chunk in model.generate_content(inputs, stream=True):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunk without text parts (e.g. the final finish_reason chunk)
+                        continue
+                    chunks.append(text)
+                    yield text
+                break
+            except Exception as e:
+                # Output already shown to the caller can't be taken back,
+                # so only retry when nothing has been streamed yet.
+                if not chunks and self._is_retryable(e) and attempt < max_retries - 1:
+                    sleep_time = (2 ** attempt) + random.uniform(0, 1)
+                    print(f"Transient error ({e}). Retrying in {sleep_time:.2f}s...")
+                    time.sleep(sleep_time)
+                    continue
+                print(f"Gemini Error (Attempt {attempt+1}): {e}")
+                raise
+
+        result = self.parse_response("".join(chunks))
+        self._cache_put(cache_key, result)
+
+    async def _generate_with_retry_async(self, model, inputs, max_retries=3, limiter=None):
+        for attempt in range(max_retries):
+            try:
+                if limiter:
+                    await limiter.acquire()
+                response = await model.generate_content_async(inputs)
+            except Exception as e:
+                if self._is_retryable(e):
+                    if attempt < max_retries - 1:
+                        sleep_time = (2 ** attempt) + random.uniform(0, 1)
+                        print(f"Transient error ({e}). Retrying in {sleep_time:.2f}s...")
+                        await asyncio.sleep(sleep_time)
+                        continue
+                print(f"Gemini Error (Attempt {attempt+1}): {e}")
+                return {"error": f"Failed after {attempt+1} attempts: {str(e)}"}
+            try:
+                text = response.text
+            except ValueError as e:
+                return {"error": f"Model returned no text: {e}"}
+            return self.parse_response(text)
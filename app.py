@@ -1,6 +1,13 @@
 import streamlit as st
+import asyncio
+import hashlib
 import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfReader
 from ai_service import AIService
+from config import PROVIDER_OPTIONS, CONFIG_MAP, MODEL_PRICING, MODEL_INFO, MIME_BY_EXT
 from excel_builder import ExcelBuilder
 import utils
 
@@ -12,59 +19,22 @@ st.markdown("Extract menu data from images or PDFs and generate import-ready Exc
 # Sidebar - Configuration
 st.sidebar.header("Configuration")
 
-# Provider Options
-provider_options = [
-    "Google Gemini 2.5 Flash",
-    "Google Gemini 2.5 Pro",
-    "Google Gemini 3 Flash",
-    "Google Gemini 3.1 Pro",
-]
-
-provider_selection = st.sidebar.selectbox("AI Model", provider_options)
-api_key = st.sidebar.text_input("API Key", type="password", help="Enter API Key for the selected provider")
-
-# Map selection to (provider_code, model_name)
-config_map = {
-    "Google Gemini 2.5 Flash": ("gemini", "gemini-2.5-flash"),
-    "Google Gemini 2.5 Pro": ("gemini", "gemini-2.5-pro"),
-    "Google Gemini 3 Flash": ("gemini", "gemini-3-flash-preview"),
-    "Google Gemini 3.1 Pro": ("gemini", "gemini-3.1-pro-preview"),
-}
-
-# Pricing Data (Per 1 Million Tokens)
-# Source: Google AI Studio Pricing (Approximate public rates)
-MODEL_PRICING = {
-    "gemini-2.5-flash": {
-        "input_price": 0.075,
-        "output_price": 0.30,
-        "rpm": "15 Requests Per Minute (Free) / 1000 pay-as-you-go",
-        "limit": "1M Context"
-    },
-    "gemini-2.5-pro": {
-        "input_price": 3.50,
-        "output_price": 10.50,
-        "rpm": "2 Requests Per Minute (Free) / 360 pay-as-you-go",
-        "limit": "2M Context"
-    },
-    "gemini-3-flash-preview": {
-        "input_price": 0.00,
-        "output_price": 0.00,
-        "rpm": "Preview - Rate limits apply",
-        "limit": "1M Context"
-    },
-    "gemini-3.1-pro-preview": {
-        "input_price": 0.00,
-        "output_price": 0.00,
-        "rpm": "Preview - Rate limits apply",
-        "limit": "2M Context"
-    },
-}
-
-def estimate_cost(uploaded_file, model_key):
+# In a form, typing the key or switching models doesn't rerun the app until "Apply";
+# the submitted values are kept for every rerun after that.
+with st.sidebar.form("config"):
+    provider_selection = st.selectbox("AI Model", PROVIDER_OPTIONS)
+    api_key = st.text_input("API Key", type="password", help="Enter API Key for the selected provider")
+    st.form_submit_button("Apply")
+
+@st.cache_data(show_spinner=False)
+def estimate_cost(_uploaded_file, file_id, model_key):
     """
     Estimates cost based on file type and model rates.
+    Cached per (upload, model) so widget reruns don't re-read the PDF;
+    the file itself is excluded from hashing, file_id identifies it.
     Returns (estimated_cost, rpm_info)
     """
+    uploaded_file = _uploaded_file
     pricing_key = model_key
 
     if not uploaded_file or pricing_key not in MODEL_PRICING:
@@ -76,17 +46,16 @@ def estimate_cost(uploaded_file, model_key):
     input_tokens = 0
     if uploaded_file.type == "application/pdf":
         try:
-            # Create a BytesIO object from the uploaded file to pass to PdfReader
-            from io import BytesIO
-            pdf_file_obj = BytesIO(uploaded_file.getvalue())
-            pdf_reader = PyPDF2.PdfReader(pdf_file_obj)
-            num_pages = len(pdf_reader.pages)
+            # UploadedFile is already a seekable file object; read it in place instead of copying
+            uploaded_file.seek(0)
+            num_pages = len(PdfReader(uploaded_file, strict=False).pages)
             # PDF to Image conversion approx: 258 tokens per page (Gemini standard image input) + Text overhead
             # Safe estimate: 1000 tokens per page (Text + Image overhead)
             input_tokens = num_pages * 1000
-            # No need to reset pointer for uploaded_file itself, as we used a BytesIO copy
         except Exception:
             input_tokens = 5000 # Fallback for unreadable PDFs or errors
+        finally:
+            uploaded_file.seek(0)
     else:
         # Image (PNG, JPG, JPEG)
         input_tokens = 258 # Gemini standard image token cost for a single image
@@ -106,58 +75,36 @@ def estimate_cost(uploaded_file, model_key):
 
     return total_max, pricing["rpm"]
 
-# Model Information for UI
-MODEL_INFO = {
-    "Google Gemini 2.5 Flash": {
-        "desc": "Fast, efficient multimodal model for general-purpose tasks.",
-        "price": "Free Tier: 15 RPM, 1,500 RPD. Paid: $0.075 / 1M input tokens.",
-        "strength": "Balanced speed and cost. Excellent for standard menu extraction.",
-        "limit": "1M Context. Good for most menus.",
-        "url": "https://ai.google.dev/gemini-api/docs/models"
-    },
-    "Google Gemini 2.5 Pro": {
-        "desc": "High-reasoning model designed for complex tasks and large document analysis.",
-        "price": "Free Tier: 2 RPM, 50 RPD. Paid: $3.50 / 1M input tokens.",
-        "strength": "Superior reasoning for complex modifier logic and messy handwritten menus.",
-        "limit": "Slower analysis. Lower RPM limits in Free tier. 2M Context.",
-        "url": "https://ai.google.dev/gemini-api/docs/models"
-    },
-    "Google Gemini 3 Flash": {
-        "desc": "Next-gen multimodal model with strong coding and state-of-the-art reasoning.",
-        "price": "Preview - Free while in preview.",
-        "strength": "Best for complex multimodal understanding and agentic tasks.",
-        "limit": "Preview stability. 1M Context.",
-        "url": "https://ai.google.dev/gemini-api/docs/models"
-    },
-    "Google Gemini 3.1 Pro": {
-        "desc": "Latest reasoning-first model optimized for complex agentic workflows.",
-        "price": "Preview - Free while in preview.",
-        "strength": "Cutting-edge reasoning and coding capabilities.",
-        "limit": "Preview stability. 2M Context.",
-        "url": "https://ai.google.dev/gemini-api/docs/models"
-    },
-}
-
-selected_provider_code, selected_model_name = config_map.get(provider_selection, ("gemini", "gemini-2.5-flash"))
+selected_provider_code, selected_model_name = CONFIG_MAP.get(provider_selection, ("gemini", "gemini-2.5-flash"))
+
+@st.cache_data(show_spinner=False)
+def upload_digest(_uploaded_file, file_id):
+    """SHA-256 of an upload's content, computed once per upload."""
+    return hashlib.sha256(_uploaded_file.getbuffer()).hexdigest()
+
+@st.cache_data(show_spinner=False)
+def model_info_markdown(provider_selection):
+    """Sidebar details for the selected model, built once per model."""
+    # Fallback info
+    info = MODEL_INFO.get(provider_selection, {
+        "desc": "High-performance AI model.",
+        "price": "Check provider official pricing page.",
+        "strength": "General extraction tasks.",
+        "limit": "Standard limits apply.",
+        "url": "https://ai.google.dev/models"
+    })
+
+    return (f"**{provider_selection}**\n\n"
+            f"📝 **Description:** {info['desc']}\n\n"
+            f"💰 **Pricing & Limits:** {info['price']}\n\n"
+            f"💪 **Strengths:** {info['strength']}\n\n"
+            f"⚠️ **Known Limitations:** {info['limit']}\n\n"
+            f"[Official Documentation]({info['url']})")
 
 # Display Model Info in Sidebar
 st.sidebar.markdown("---")
 st.sidebar.subheader("Model Details")
-# Fallback info
-info = MODEL_INFO.get(provider_selection, {
-    "desc": "High-performance AI model.",
-    "price": "Check provider official pricing page.",
-    "strength": "General extraction tasks.",
-    "limit": "Standard limits apply.",
-    "url": "https://ai.google.dev/models"
-})
-
-st.sidebar.info(f"**{provider_selection}**\n\n"
-                f"📝 **Description:** {info['desc']}\n\n"
-                f"💰 **Pricing & Limits:** {info['price']}\n\n"
-                f"💪 **Strengths:** {info['strength']}\n\n"
-                f"⚠️ **Known Limitations:** {info['limit']}\n\n"
-                f"[Official Documentation]({info['url']})")
+st.sidebar.info(model_info_markdown(provider_selection))
 
 # Main Area
 st.info("ℹ️ **App Overview:** This tool populates the **Item**, **Submenu**, **SubmenuItem**, and **ModifierGroup_Items** tabs.\n\n"
@@ -179,15 +126,134 @@ with st.expander("📄 Need a blank template?"):
         except Exception as e:
             st.error(f"Could not generate template: {e}")
 
+def stream_to_preview(chunks):
+    """
+    Show the model output in a live preview while it streams in.
+    Returns the full response text.
+    """
+    preview = st.empty()
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        # Only the tail is shown; the parsed result is previewed after extraction
+        preview.code(text[-1500:], language="json")
+    preview.empty()
+    return text
+
+PREVIEW_ROWS = 5
+
+@st.fragment
+def render_results(data, excel_data, file_name):
+    """
+    Download button and data preview for a finished extraction.
+    As a fragment, clicking the download only reruns this block, not the whole app.
+    """
+    st.download_button(
+        label="📥 Download Excel File",
+        data=excel_data,
+        file_name=file_name,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    # Preview Data (Optional)
+    with st.expander("Preview Extracted Data"):
+        # Large menus are many KB of JSON; send the full structure only when asked for
+        if st.checkbox("Show full JSON", key=f"full_json_{file_name}"):
+            st.json(data, expanded=False)
+        else:
+            st.caption(f"First {PREVIEW_ROWS} entries of each list.")
+            st.json({k: v[:PREVIEW_ROWS] if isinstance(v, list) else v for k, v in data.items()})
+
+# scrape_url reports these as its return value rather than raising
+SCRAPE_FAILURES = ("Error scraping URL", "HTTP Error ", "WARNING: The scraped content is very short")
+
+class ScrapeError(Exception):
+    pass
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def cached_scrape(url):
+    """
+    utils.scrape_url, memoized for an hour so retrying the same menu URL skips the fetch.
+    Failed or near-empty scrapes raise ScrapeError instead, so they are not cached.
+    """
+    text = utils.scrape_url(url)
+    if text.startswith(SCRAPE_FAILURES):
+        raise ScrapeError(text)
+    return text
+
+@st.cache_resource
+def get_ai_service():
+    """One AIService for all reruns and sessions; it holds no per-user state."""
+    return AIService()
+
+@st.cache_resource
+def get_executor():
+    """Worker threads shared by all sessions, so extraction doesn't block the script thread."""
+    return ThreadPoolExecutor(max_workers=4)
+
+def run_upload_job(job, ai_service, file_bytes, mime_type, api_key, provider_code, model_name, rpm_limit):
+    """
+    Extract menu data from an upload's bytes and build the Excel file.
+    Runs on the executor, so it must not call Streamlit: progress is written
+    to job["step"] and the streamed model output to job["preview"].
+    Returns {"data": ..., "excel": bytes} or {"error": ...}.
+    """
+    parts = []
+    if mime_type == "application/pdf":
+        # Multi-page PDFs are split and the parts analyzed in parallel. On rate-limited
+        # models several pages share one request, so the whole file fits in a minute's quota.
+        parts = utils.split_pdf_pages(file_bytes, max_parts=rpm_limit)
+    else:
+        job["step"] = "Preparing image..."
+        small = utils.downscale_image(file_bytes)
+        if small:
+            file_bytes, mime_type = small, "image/jpeg"
+
+    if len(parts) > 1:
+        job["step"] = f"Analyzing {len(parts)} parts of the PDF..."
+        pages = [(part, "application/pdf") for part in parts]
+        results = asyncio.run(ai_service.batch_analyze(pages, api_key, provider=provider_code, model_name=model_name, rpm=rpm_limit))
+        data = ai_service.merge_results(results)
+    else:
+        job["step"] = "Analyzing menu..."
+        text = ""
+        for chunk in ai_service.stream_analyze_bytes(file_bytes, mime_type, api_key, provider=provider_code, model_name=model_name):
+            text += chunk
+            # Only the tail is shown; the parsed result is previewed after extraction
+            job["preview"] = text[-1500:]
+        data = ai_service.parse_response(text)
+
+    if "error" in data:
+        return {"error": data["error"]}
+
+    job["step"] = "Building Excel file..."
+    builder = ExcelBuilder()
+    builder.add_data(data)
+    return {"data": data, "excel": builder.build_excel()}
+
+@st.fragment(run_every=0.5)
+def job_progress(job):
+    """
+    Progress of a running extraction. Only this fragment reruns while the job
+    is working; once it finishes, the whole app reruns to show the result.
+    """
+    if job["future"].done():
+        st.rerun(scope="app")
+    elapsed = time.monotonic() - job["started"]
+    with st.status(f"{job['step']} ({elapsed:.0f}s)", expanded=True):
+        st.caption("Extraction runs in the background; the sidebar and other tabs stay usable.")
+        if job["preview"]:
+            st.code(job["preview"], language="json")
+
 tab_upload, tab_url = st.tabs(["📂 File Upload", "🌐 URL (Coming Soon)"])
 
 with tab_upload:
-    uploaded_file = st.file_uploader("Upload Menu (PDF, PNG, JPG)", type=["pdf", "png", "jpg", "jpeg"])
+    uploaded_file = st.file_uploader("Upload Menu (PDF, PNG, JPG)", type=list(MIME_BY_EXT))
 
     if uploaded_file and api_key:
 
         # Display Cost Estimation
-        est_cost, rpm_info = estimate_cost(uploaded_file, selected_model_name)
+        est_cost, rpm_info = estimate_cost(uploaded_file, uploaded_file.file_id, selected_model_name)
         
         st.info(f"""
         **📊 Estimation (Safe Upper Bound)**
@@ -195,66 +261,53 @@ with tab_upload:
         - **Est. Cost**: < ${est_cost:.4f} USD
         - **RPM Limit**: {rpm_info}
         
-        *Note: 1 Request = Processing 1 Uploaded File.*
+        *Note: 1 Request = 1 Image, or 1 Page of a multi-page PDF (pages are grouped to stay within the RPM limit).*
         """)
 
-        if st.button("🚀 Extract Menu Data", type="primary"):
-            with st.status("Processing...", expanded=True) as status:
-                try:
-                    # 1. Save file
-                    st.write("Saving uploaded file...")
-                    file_path = utils.save_uploaded_file(uploaded_file)
-                    if not file_path:
-                        st.error("Failed to save file.")
-                        st.stop()
-                    
-                    # Determine Mime Type
-                    mime_type = "application/pdf" if uploaded_file.name.lower().endswith(".pdf") else "image/jpeg"
-                    if uploaded_file.name.lower().endswith(".png"):
-                        mime_type = "image/png"
-                        
-                    # 2. Call AI
-                    st.write(f"Analyzing with {provider_selection}...")
-                    ai_service = AIService()
-                    
-                    data = ai_service.analyze_file(file_path, mime_type, api_key, provider=selected_provider_code, model_name=selected_model_name)
-                    
-                    if "error" in data:
-                        st.error(f"AI Error: {data['error']}")
-                        status.update(label="Failed", state="error")
-                    else:
-                        st.write("Parsing data...")
-                        # 3. Build Excel
-                        builder = ExcelBuilder()
-                        builder.add_data(data)
-                        excel_data = builder.build_excel()
-                        
-                        st.success("Extraction Complete!")
-                        status.update(label="Complete!", state="complete")
-                        
-                        # 4. Download
-                        st.download_button(
-                            label="📥 Download Excel File",
-                            data=excel_data,
-                            file_name="Aloha_Import_Ready.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-                        
-                        # Preview Data (Optional)
-                        with st.expander("Preview Extracted Data"):
-                            st.json(data)
+        # Jobs are keyed by file content, so reruns and re-uploads of the same menu find their job
+        jobs = st.session_state.setdefault("upload_jobs", {})
+        job_key = upload_digest(uploaded_file, uploaded_file.file_id)
+        job = jobs.get(job_key)
+
+        if st.button("🚀 Extract Menu Data", type="primary", disabled=job is not None and not job["future"].done()):
+            # Read once and pass the bytes along; no temp file to write, re-read or clean up
+            file_bytes = uploaded_file.getvalue()
+
+            # Determine Mime Type
+            ext = uploaded_file.name.rsplit(".", 1)[-1].lower()
+            mime_type = MIME_BY_EXT.get(ext, "image/jpeg")
+
+            # The worker reports progress through this dict; the script thread renders it
+            job = {"step": "Starting...", "preview": "", "started": time.monotonic()}
+            rpm_limit = MODEL_PRICING.get(selected_model_name, {}).get("rpm_limit")
+            job["future"] = get_executor().submit(
+                run_upload_job, job, get_ai_service(), file_bytes, mime_type, api_key,
+                selected_provider_code, selected_model_name, rpm_limit
+            )
+            jobs[job_key] = job
+
+        if job:
+            future = job["future"]
+            if not future.done():
+                job_progress(job)
+            elif future.exception() is not None:
+                error = future.exception()
+                st.error(f"An error occurred: {str(error)}")
+                st.code("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+            elif "error" in future.result():
+                st.error(f"AI Error: {future.result()['error']}")
+            else:
+                outcome = future.result()
+                data = outcome["data"]
+                if data.get("partial"):
+                    st.warning("Part of the menu could not be extracted (the model output was cut off or a page failed). The workbook contains the entries that were extracted.")
+                st.success("Extraction Complete!")
+
+                # 4. Download
+                render_results(data, outcome["excel"], "Aloha_Import_Ready.xlsx")
 
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    import traceback
-                    st.code(traceback.format_exc())
-                finally:
-                    # Cleanup
-                    if 'file_path' in locals():
-                        utils.cleanup_temp_file(file_path)
-    
     elif not api_key:
-        st.warning("Please enter your API Key in the sidebar to proceed.")
+        st.warning("Please enter your API Key in the sidebar and press Apply to proceed.")
 
 with tab_url:
     url_input = st.text_input("Enter Menu URL", placeholder="https://example.com/menu")
@@ -265,25 +318,37 @@ with tab_url:
                 try:
                     # 1. Scrape
                     st.write("Scraping website...")
-                    scraped_text = utils.scrape_url(url_input)
-                    
-                    if "Error scraping URL" in scraped_text:
-                        st.error(scraped_text)
+                    try:
+                        scraped_text = cached_scrape(url_input)
+                    except ScrapeError as e:
+                        st.error(str(e))
+                        status.update(label="Failed", state="error")
                         st.stop()
                         
                     st.success("Scraping successful! (Preview first 500 chars)")
                     st.caption(scraped_text[:500] + "...")
                         
                     # 2. Call AI
-                    st.write(f"Analyzing text with {provider_selection}...")
-                    ai_service = AIService()
-                    
-                    data = ai_service.analyze_text(scraped_text, api_key, provider=selected_provider_code, model_name=selected_model_name)
+                    ai_service = get_ai_service()
+
+                    # Long pages are split into sections and analyzed in parallel
+                    text_chunks = utils.chunk_by_headings(scraped_text)
+                    if len(text_chunks) > 1:
+                        st.write(f"Analyzing {len(text_chunks)} sections with {provider_selection}...")
+                        rpm_limit = MODEL_PRICING.get(selected_model_name, {}).get("rpm_limit")
+                        results = asyncio.run(ai_service.batch_analyze_texts(text_chunks, api_key, provider=selected_provider_code, model_name=selected_model_name, rpm=rpm_limit))
+                        data = ai_service.merge_results(results)
+                    else:
+                        st.write(f"Analyzing text with {provider_selection}...")
+                        response_text = stream_to_preview(ai_service.stream_analyze_text(scraped_text, api_key, provider=selected_provider_code, model_name=selected_model_name))
+                        data = ai_service.parse_response(response_text)
                     
                     if "error" in data:
                         st.error(f"AI Error: {data['error']}")
                         status.update(label="Failed", state="error")
                     else:
+                        if data.get("partial"):
+                            st.warning("Part of the menu could not be extracted (the model output was cut off or a page failed). The workbook contains the entries that were extracted.")
                         st.write("Parsing data...")
                         builder = ExcelBuilder()
                         builder.add_data(data)
@@ -291,19 +356,15 @@ with tab_url:
                         
                         st.success("Extraction Complete!")
                         status.update(label="Complete!", state="complete")
-                        
-                        st.download_button(
-                            label="📥 Download Excel File",
-                            data=excel_data,
-                            file_name="Aloha_Import_Ready_From_URL.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-                        
-                        with st.expander("Preview Extracted Data"):
-                            st.json(data)
+
+                        # Kept per URL so the download survives the rerun its own click triggers
+                        st.session_state.setdefault("url_results", {})[url_input] = {"data": data, "excel": excel_data}
                             
                 except Exception as e:
                      st.error(f"An error occurred: {str(e)}")
-    elif not api_key:
-        st.warning("Please enter your API Key in the sidebar to proceed.")
 
+        url_result = st.session_state.get("url_results", {}).get(url_input)
+        if url_result:
+            render_results(url_result["data"], url_result["excel"], "Aloha_Import_Ready_From_URL.xlsx")
+    elif not api_key:
+        st.warning("Please enter your API Key in the sidebar and press Apply to proceed.")
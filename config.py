@@ -0,0 +1,95 @@
+"""
+Static configuration for the Streamlit app (models, pricing, upload types).
+
+Kept out of app.py so it is built once at import instead of on every rerun.
+"""
+from types import MappingProxyType
+
+# Provider Options
+PROVIDER_OPTIONS = (
+    "Google Gemini 2.5 Flash",
+    "Google Gemini 2.5 Pro",
+    "Google Gemini 3 Flash",
+    "Google Gemini 3.1 Pro",
+)
+
+# Map selection to (provider_code, model_name)
+CONFIG_MAP = MappingProxyType({
+    "Google Gemini 2.5 Flash": ("gemini", "gemini-2.5-flash"),
+    "Google Gemini 2.5 Pro": ("gemini", "gemini-2.5-pro"),
+    "Google Gemini 3 Flash": ("gemini", "gemini-3-flash-preview"),
+    "Google Gemini 3.1 Pro": ("gemini", "gemini-3.1-pro-preview"),
+})
+
+# Pricing Data (Per 1 Million Tokens)
+# Source: Google AI Studio Pricing (Approximate public rates)
+MODEL_PRICING = {
+    "gemini-2.5-flash": {
+        "input_price": 0.075,
+        "output_price": 0.30,
+        "rpm": "15 Requests Per Minute (Free) / 1000 pay-as-you-go",
+        "rpm_limit": 15,  # Free-tier cap used to pace parallel page requests
+        "limit": "1M Context"
+    },
+    "gemini-2.5-pro": {
+        "input_price": 3.50,
+        "output_price": 10.50,
+        "rpm": "2 Requests Per Minute (Free) / 360 pay-as-you-go",
+        "rpm_limit": 2,
+        "limit": "2M Context"
+    },
+    "gemini-3-flash-preview": {
+        "input_price": 0.00,
+        "output_price": 0.00,
+        "rpm": "Preview - Rate limits apply",
+        "rpm_limit": None,
+        "limit": "1M Context"
+    },
+    "gemini-3.1-pro-preview": {
+        "input_price": 0.00,
+        "output_price": 0.00,
+        "rpm": "Preview - Rate limits apply",
+        "rpm_limit": None,
+        "limit": "2M Context"
+    },
+}
+
+# Model Information for UI
+MODEL_INFO = {
+    "Google Gemini 2.5 Flash": {
+        "desc": "Fast, efficient multimodal model for general-purpose tasks.",
+        "price": "Free Tier: 15 RPM, 1,500 RPD. Paid: $0.075 / 1M input tokens.",
+        "strength": "Balanced speed and cost. Excellent for standard menu extraction.",
+        "limit": "1M Context. Good for most menus.",
+        "url": "https://ai.google.dev/gemini-api/docs/models"
+    },
+    "Google Gemini 2.5 Pro": {
+        "desc": "High-reasoning model designed for complex tasks and large document analysis.",
+        "price": "Free Tier: 2 RPM, 50 RPD. Paid: $3.50 / 1M input tokens.",
+        "strength": "Superior reasoning for complex modifier logic and messy handwritten menus.",
+        "limit": "Slower analysis. Lower RPM limits in Free tier. 2M Context.",
+        "url": "https://ai.google.dev/gemini-api/docs/models"
+    },
+    "Google Gemini 3 Flash": {
+        "desc": "Next-gen multimodal model with strong coding and state-of-the-art reasoning.",
+        "price": "Preview - Free while in preview.",
+        "strength": "Best for complex multimodal understanding and agentic tasks.",
+        "limit": "Preview stability. 1M Context.",
+        "url": "https://ai.google.dev/gemini-api/docs/models"
+    },
+    "Google Gemini 3.1 Pro": {
+        "desc": "Latest reasoning-first model optimized for complex agentic workflows.",
+        "price": "Preview - Free while in preview.",
+        "strength": "Cutting-edge reasoning and coding capabilities.",
+        "limit": "Preview stability. 2M Context.",
+        "url": "https://ai.google.dev/gemini-api/docs/models"
+    },
+}
+
+# Accepted upload extensions and the MIME type they are sent to the model as
+MIME_BY_EXT = MappingProxyType({
+    "pdf": "application/pdf",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+})
@@ -1,14 +1,93 @@
 
 import openpyxl
+from openpyxl import LXML
 from openpyxl.styles import Font, Alignment, Protection, Border, Side
 from openpyxl.comments import Comment
 from openpyxl.worksheet.datavalidation import DataValidation
 from openpyxl.worksheet.protection import SheetProtection
 from openpyxl.utils import quote_sheetname, get_column_letter
+import functools
+import itertools
 import os
 import sys
 import io
 import re
+import time
+import warnings
+from typing import BinaryIO, Optional
+
+# openpyxl serialises sheet XML through lxml when it is importable and otherwise falls back to a slower shim
+if not LXML:
+    warnings.warn("lxml is not installed; workbook saves will use openpyxl's slower pure-Python writer.")
+
+# Characters that survive cleaning: letters, digits, whitespace, basic punctuation and Latin-1 accents
+_CLEAN_RE = re.compile(r'[^a-zA-Z0-9\s\.,\'\-\(\)\&/<> \u00C0-\u00FF]')
+# The ASCII characters that filter drops, for bytes.translate (a single C pass, unlike
+# str.translate, which goes through a dict lookup per character)
+_ASCII_DROP = bytes(c for c in range(128) if _CLEAN_RE.match(chr(c)))
+
+# Styles are immutable and shared by value, so one instance serves every cell
+_UNLOCKED = Protection(locked=False)
+_NOTE_FONT = Font(italic=True, size=9)
+_BOLD_FONT = Font(bold=True)
+_PLAIN_FONT = Font(bold=False)
+_GUIDE_FONT = Font(italic=True)
+_HEADER_FONT = Font(name='Cambria', size=11, bold=True)
+
+# Currency symbol and thousands separators the model sometimes leaves in prices
+_PRICE_STRIP = str.maketrans('', '', '$,')
+
+# Numeric ShortName suffixes, indexed by value
+_SUFFIXES = tuple(str(i) for i in range(1000))
+
+# Placeholder for price cells that become an Item-sheet VLOOKUP in build_final
+_FORMULA = object()
+
+
+# The same names are cleaned repeatedly (short-name generation, lookups, then every
+# cell at write time), so results are memoized
+@functools.lru_cache(maxsize=4096)
+def _clean_text(text):
+    if text.isascii():
+        # Plain ASCII words have nothing to strip
+        if text.isalnum():
+            return text
+        return text.encode('ascii').translate(None, _ASCII_DROP).decode('ascii').strip()
+    return _CLEAN_RE.sub('', text).strip()
+
+
+def _parse_price(value):
+    """Coerce a price from the AI JSON to float. None stays None; anything unparseable is 0.0."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            return float(value.translate(_PRICE_STRIP))
+        except ValueError:
+            return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return 0.0
+
+
+@functools.lru_cache(maxsize=4)
+def _read_template(path, mtime):
+    # Keyed on mtime so a replaced template file is picked up without a restart
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _clear_below_header(ws):
+    """
+    Drop every row below the header, leaving row_dimensions alone like delete_rows does.
+
+    The template pre-styles ~150k cells per sheet and delete_rows shifts each of them
+    before dropping it (~170ms a sheet), so this rebuilds the worksheet's private cell
+    store directly. Those internals are why requirements.txt keeps openpyxl below 3.2.
+    """
+    if ws.max_row > 1:
+        ws._cells = {key: cell for key, cell in ws._cells.items() if key[0] == 1}
+        ws._current_row = 1 if ws._cells else 0
 
 
 class UniqueNameGenerator:
@@ -21,18 +100,24 @@ class UniqueNameGenerator:
         self.seen_shortnames = set()           # Track all used ShortNames
         self.full_to_short = {}                # "Eggplant Margherita Pizza (Personal)" → "Eggplant Margh1"
         self.full_to_long = {}                 # "Eggplant Margherita Pizza (Personal)" → "Eggplant Margherita Pi"
+        self.prefix_to_short = {}              # First 15 cleaned chars → shortname of the first name seen
+        self._next_suffix = {}                 # First 14 cleaned chars → next numeric suffix to try
         
         # Separate tracking by entity type for clarity
         self.item_names = {}                   # Item full_name → shortname
         self.modifier_group_names = {}         # ModGroup full_name → shortname  
         self.submenu_names = {}                # Submenu full_name → shortname
+        self._by_type = {
+            "item": self.item_names,
+            "modifier_group": self.modifier_group_names,
+            "submenu": self.submenu_names,
+        }
     
     def clean_text(self, text):
         """Clean text of special characters before processing."""
         if not text:
             return ""
-        cleaned = re.sub(r'[^a-zA-Z0-9\s\.,\'\-\(\)\&/<> \u00C0-\u00FF]', '', str(text))
-        return cleaned.strip()
+        return _clean_text(str(text))
     
     def generate_unique_shortname(self, full_name, entity_type="item"):
         """
@@ -57,8 +142,8 @@ class UniqueNameGenerator:
         if full_name in self.full_to_short:
             return self.full_to_short[full_name], self.full_to_long[full_name]
         
-        # Generate LongName (23 chars)
-        long_name = cleaned[:23]
+        # Generate LongName (23 chars); interned so names truncating to the same text share one object
+        long_name = sys.intern(cleaned[:23])
         
         # Generate base ShortName (15 chars)
         base_short = cleaned[:15]
@@ -74,45 +159,32 @@ class UniqueNameGenerator:
         self.seen_shortnames.add(short_name)
         self.full_to_short[full_name] = short_name
         self.full_to_long[full_name] = long_name
+        self.prefix_to_short.setdefault(base_short, short_name)
         
         # Store in entity-specific dict
-        if entity_type == "item":
-            self.item_names[full_name] = short_name
-        elif entity_type == "modifier_group":
-            self.modifier_group_names[full_name] = short_name
-        elif entity_type == "submenu":
-            self.submenu_names[full_name] = short_name
+        names_for_type = self._by_type.get(entity_type)
+        if names_for_type is not None:
+            names_for_type[full_name] = short_name
         
         return short_name, long_name
     
     def _get_unique_with_suffix(self, cleaned_name):
         """
         Generate unique ShortName with numeric suffix.
-        Tries: base14 + 1-9, then base13 + 10-99
+        Tries: base14 + 1-9, then base13 + 10-99, then base12 + 100-999
         """
-        # Try single digit suffix (1-9)
+        # Every candidate is derived from the first 14 chars, and taken names never
+        # free up, so resume from where the last probe for this prefix stopped
         base14 = cleaned_name[:14]
-        for i in range(1, 10):
-            candidate = f"{base14}{i}"
-            if candidate not in self.seen_shortnames:
-                return candidate
-        
-        # Try double digit suffix (10-99)
-        base13 = cleaned_name[:13]
-        for i in range(10, 100):
-            candidate = f"{base13}{i}"
-            if candidate not in self.seen_shortnames:
-                return candidate
-        
-        # Fallback: triple digit (very unlikely)
-        base12 = cleaned_name[:12]
-        for i in range(100, 1000):
-            candidate = f"{base12}{i}"
+        for i in range(self._next_suffix.get(base14, 1), 1000):
+            suffix = _SUFFIXES[i]
+            candidate = cleaned_name[:15 - len(suffix)] + suffix
             if candidate not in self.seen_shortnames:
+                self._next_suffix[base14] = i + 1
                 return candidate
+        self._next_suffix[base14] = 1000
         
         # Last resort: just return with timestamp-like suffix
-        import time
         return f"{cleaned_name[:10]}{int(time.time()) % 100000}"
     
     def lookup_shortname(self, full_name, entity_type=None):
@@ -125,15 +197,116 @@ class UniqueNameGenerator:
         
         # Try truncated match (AI might have given slightly different name)
         cleaned = self.clean_text(full_name) if full_name else ""
-        for stored_full, short in self.full_to_short.items():
-            if self.clean_text(stored_full)[:15] == cleaned[:15]:
-                return short
+        short = self.prefix_to_short.get(cleaned[:15])
+        if short is not None:
+            return short
         
         # Not found - return truncated version (will likely fail validation but logged)
         return cleaned[:15] if cleaned else ""
 
 
 class ExcelBuilder:
+    # Items 3-5 of the Instructions tab's IMPORTANT INSTRUCTIONS list
+    _EXTRA_INSTRUCTION_LINES = (
+        "3. All dropdowns are protected - select from the list only.",
+        "4. Fields left blank will be auto-generated based on database defaults.",
+        "5. Right-click row number -> Insert to add rows in ModifierGroup_Items.",
+    )
+
+    # Instructions-tab text written below the TIPS paragraph
+    _BUTTON_EXPL_LINES = (
+        "",
+        "BUTTON POSITION LOGIC:",
+        "1. MenuSubmenu (ButtonPositionIndex):",
+        "   - Sequential number (0, 1, 2...) determining sort order.",
+        "",
+        "2. SubmenuItem & ModifierGroup_Items (Row/Column):",
+        "   - Layout: 3 Columns x 7 Rows per page.",
+        "   - Rows: Start at 0 and ascend.",
+        "   - Logic: Row = Index // 3, Column = Index % 3.",
+        "",
+        "NOTE: Ensure no duplicate position combinations within the same Group.",
+        "",
+        "MODIFIER GROUPS:",
+        " - First Row: Enter Group Number, ShortName, LongName, AND First Item.",
+        " - D,E,F,G (Min/Max/Free/FlowRequired): Only for group header rows.",
+        " - Rows Below: Leave A-C BLANK. Enter Items in Cols I-M.",
+        " - To Add More Items: Right Click Row Number -> Insert."
+    )
+    _BOLD_LINE_MARKERS = frozenset({"BUTTON POSITION LOGIC:", "MODIFIER GROUPS:"})
+
+    # Per-column flags for rows built in add_data: False marks columns that only ever
+    # hold fixed literals ("Standard", "Item Price", ...) and so never need cleaning
+    _CLEAN_COLUMNS = {
+        "Item": (True, True, True, False, True, False) + (True,) * 12,
+        "ModifierGroup_Items": (True,) * 12 + (False,),
+        "SubmenuItem": (True, False, True, False, True, True, True),
+    }
+
+    # Last row covered by data validations: fixed for the blank template, data rows + buffer otherwise
+    _TEMPLATE_VALIDATION_ROWS = 5000
+    _VALIDATION_BUFFER_ROWS = 500
+
+    # Sheets that are exported with headers only, whatever add_data collected
+    _EMPTY_DATA_SHEETS = frozenset({"Category", "TaxGroup", "MenuSubmenu"})
+
+    # Sheets whose price column holds a _FORMULA placeholder: (price index, ItemName column letter)
+    _PRICE_FORMULA_COLUMNS = {
+        "ModifierGroup_Items": (9, "I"),
+        "SubmenuItem": (6, "C"),
+    }
+
+    # Dropdown source range on each lookup sheet (ShortName column)
+    _LIST_FORMULAS = {
+        sheet: f"{quote_sheetname(sheet)}!{col_range}"
+        for sheet, col_range in (
+            ("Category", "$B$2:$B$500"),
+            ("TaxGroup", "$B$2:$B$500"),
+            ("ModifierGroup_Items", "$B$2:$B$200"),
+            ("Item", "$B$2:$B$2000"),
+            ("Submenu", "$B$2:$B$500"),
+            ("Menu", "$B$2:$B$100"),
+        )
+    }
+
+    # Data validations per sheet: ((first_col, last_col), type, formula1, allow_blank, errorTitle, error).
+    # Every rule shows its error; each range runs from row 2 down to the validation limit.
+    _STRICT = ("Invalid Selection", "Select from dropdown.")
+    _VALIDATIONS = {
+        "Item": (
+            (("H", "H"), "list", _LIST_FORMULAS["Category"], True) + _STRICT,
+            (("G", "G"), "list", _LIST_FORMULAS["TaxGroup"], True) + _STRICT,
+            (("I", "R"), "list", _LIST_FORMULAS["ModifierGroup_Items"], True) + _STRICT,
+            (("D", "D"), "list", '"Standard,Gift Card"', True) + _STRICT,
+            (("F", "F"), "list", '"Item Price,Price Level,Quantity Price,Ask For Price"', True) + _STRICT,
+        ),
+        "Category": (
+            (("C", "C"), "list", '"General,Sales,Retail"', True) + _STRICT,
+        ),
+        "ModifierGroup_Items": (
+            (("I", "I"), "list", _LIST_FORMULAS["Item"], True) + _STRICT,
+            (("M", "M"), "list", '"Item Price,Button Price"', True, None, None),
+            (("J", "J"), "custom", '=M2<>"Item Price"', False,
+             None, "Price is linked to Item Default. Change Method to edit."),
+            (("G", "G"), "list", '"Yes,No"', True) + _STRICT,
+            (("D", "F"), "custom", '=OR(ISBLANK($A2), AND(NOT(ISBLANK($A2)), NOT(ISBLANK($B2)), NOT(ISBLANK($C2))))', False,
+             "Group Row Required", "These fields are only for rows with Number, ShortName, and LongName filled in."),
+            (("A", "C"), "custom", '=ISBLANK($I2)', False,
+             None, "Number, ShortName, LongName must be blank for item rows (where ItemName is filled)."),
+        ),
+        "SubmenuItem": (
+            (("A", "A"), "list", _LIST_FORMULAS["Submenu"], True) + _STRICT,
+            (("C", "C"), "list", _LIST_FORMULAS["Item"], True) + _STRICT,
+            (("B", "B"), "list", '"Item Button,PLU Button"', True) + _STRICT,
+            (("D", "D"), "list", '"Item Price,Button Price,Price Level"', True) + _STRICT,
+            (("G", "G"), "custom", '=D2<>"Item Price"', False, None, "Price is linked to Item Default."),
+        ),
+        "MenuSubmenu": (
+            (("A", "A"), "list", _LIST_FORMULAS["Menu"], True) + _STRICT,
+            (("B", "B"), "list", _LIST_FORMULAS["Submenu"], True) + _STRICT,
+        ),
+    }
+
     def __init__(self):
         self.data = {
             "Item": [],
@@ -148,14 +321,12 @@ class ExcelBuilder:
         }
         self.name_generator = UniqueNameGenerator()
         
-        # Track item indices for Phase 3 modifier assignment
-        self._item_indices = {}  # full_name → index in self.data["Item"]
         self._modifier_group_shortnames = set()  # Valid modifier group ShortNames
+        self._resolved = {}  # full_name → (ShortName, LongName), filled in Phase 0
 
     def clean_text(self, text):
         if not text: return None
-        cleaned = re.sub(r'[^a-zA-Z0-9\s\.,\'\-\(\)\&/<> \u00C0-\u00FF]', '', str(text))
-        return cleaned.strip()
+        return _clean_text(str(text))
 
     def add_data(self, json_data: dict):
         """
@@ -165,16 +336,14 @@ class ExcelBuilder:
         # Phase 0: Pre-process all names to generate unique ShortNames
         self._preprocess_names(json_data)
         
-        # Phase 1: Create all items (regular + modifier items) with I-R empty
+        # Phase 1: Create all items (regular + modifier items), filling regular items' I-R
+        # modifier group columns as each row is built
         self._create_items(json_data)
         
         # Phase 2: Create modifier groups (references Item ShortNames)
         self._create_modifier_groups(json_data)
         
-        # Phase 3: Update items with modifier group assignments (I-R columns)
-        self._assign_modifier_groups_to_items(json_data)
-        
-        # Phase 4: Create submenus and submenu items
+        # Phase 3: Create submenus and submenu items
         self._create_submenus(json_data)
 
     def _preprocess_names(self, json_data: dict):
@@ -186,31 +355,43 @@ class ExcelBuilder:
         for mg in json_data.get("modifier_groups", []):
             raw_name = mg.get("name") or ""
             if raw_name:
-                short, _ = self.name_generator.generate_unique_shortname(raw_name, "modifier_group")
+                short, _ = self._resolve_names(raw_name, "modifier_group")
                 self._modifier_group_shortnames.add(short)
             
             # Process modifier items within each group
             for m_item in mg.get("items", []):
                 m_raw = m_item.get("name") or ""
                 if m_raw:
-                    self.name_generator.generate_unique_shortname(m_raw, "item")
+                    self._resolve_names(m_raw, "item")
         
         # Process regular items
         for item in json_data.get("items", []):
             raw_name = item.get("name") or ""
             if raw_name:
-                self.name_generator.generate_unique_shortname(raw_name, "item")
+                self._resolve_names(raw_name, "item")
         
         # Process submenus
         for sm in json_data.get("submenus", []):
             raw_name = sm.get("name") or ""
             if raw_name:
-                self.name_generator.generate_unique_shortname(raw_name, "submenu")
+                self._resolve_names(raw_name, "submenu")
+
+    def _resolve_names(self, raw_name, entity_type):
+        """Generate the ShortName/LongName pair for a raw name and remember it for later phases."""
+        names = self.name_generator.generate_unique_shortname(raw_name, entity_type)
+        if names[0]:
+            self._resolved[raw_name] = names
+        return names
+
+    def _names_for(self, raw_name):
+        """(ShortName, LongName) from Phase 0; names that cleaned to nothing get a blank ShortName."""
+        return self._resolved.get(raw_name) or ("", raw_name[:23])
 
     def _create_items(self, json_data: dict):
         """
         Phase 1: Create all items (regular + modifier items).
-        Modifier group assignments (columns I-R) are left empty at this stage.
+        Regular items get their modifier group ShortNames (columns I-R) in the same pass;
+        every group ShortName is already known from Phase 0.
         """
         mod_item_number_start = 20000
         mod_item_count = 0
@@ -223,25 +404,21 @@ class ExcelBuilder:
                     continue
                 
                 # Use pre-generated ShortName
-                m_short = self.name_generator.lookup_shortname(m_raw, "item")
-                m_long = self.name_generator.full_to_long.get(m_raw, m_raw[:23])
+                m_short, m_long = self._names_for(m_raw)
                 
-                try:
-                    m_price = float(m_item.get("price", 0.0))
-                except:
+                m_price = _parse_price(m_item.get("price"))
+                if m_price is None:
                     m_price = 0.0
                 
                 m_number = mod_item_number_start + mod_item_count
                 mod_item_count += 1
                 
-                # Track index for later reference
-                self._item_indices[m_raw] = len(self.data["Item"])
-                
                 # Add item row with empty modifier assignments (I-R = None)
                 self.data["Item"].append([
                     m_number, m_short, m_long, "Standard", m_price, "Item Price",
-                    None, None  # TaxGroup, Category
-                ] + [None] * 10)  # ModifierGroup1-10 empty
+                    None, None,  # TaxGroup, Category
+                    None, None, None, None, None, None, None, None, None, None,  # ModifierGroup1-10 empty
+                ])
         
         # Then, add regular items
         for item in json_data.get("items", []):
@@ -250,21 +427,12 @@ class ExcelBuilder:
                 continue
             
             # Use pre-generated ShortName
-            short_name = self.name_generator.lookup_shortname(raw_name, "item")
-            long_name = self.name_generator.full_to_long.get(raw_name, raw_name[:23])
-            
-            try:
-                price = item.get("price", 0.0)
-                if isinstance(price, str):
-                    price = float(price.replace('$', '').replace(',', ''))
-            except:
-                price = 0.0
+            short_name, long_name = self._names_for(raw_name)
             
-            # Track index for Phase 3 modifier assignment
-            self._item_indices[raw_name] = len(self.data["Item"])
+            # A missing price (None) is left blank
+            price = _parse_price(item.get("price", 0.0))
             
-            # Add item row with empty modifier assignments (filled in Phase 3)
-            self.data["Item"].append([
+            row = [
                 item.get("number"),
                 short_name,
                 long_name,
@@ -273,7 +441,12 @@ class ExcelBuilder:
                 "Item Price",
                 None,  # TaxGroupName
                 None,  # CategoryName
-            ] + [None] * 10)  # ModifierGroup1-10 empty for now
+                None, None, None, None, None, None, None, None, None, None,  # ModifierGroup1-10
+            ]
+            # Fill columns I-R (indices 8-17); the padding Nones stay in place
+            modifier_shorts = self._modifier_group_columns(item)
+            row[8:8 + len(modifier_shorts)] = modifier_shorts
+            self.data["Item"].append(row)
 
     def _create_modifier_groups(self, json_data: dict):
         """
@@ -286,8 +459,7 @@ class ExcelBuilder:
                 continue
             
             # Use pre-generated ShortName for the group
-            mg_short = self.name_generator.lookup_shortname(raw_name, "modifier_group")
-            mg_long = self.name_generator.full_to_long.get(raw_name, raw_name[:23])
+            mg_short, mg_long = self._names_for(raw_name)
             
             mg_num = mg.get("number")
             if not isinstance(mg_num, int):
@@ -303,8 +475,7 @@ class ExcelBuilder:
             rows_needed = max(len(items), 6)
             
             for i in range(rows_needed):
-                row_pos = i // 3
-                col_pos = i % 3
+                row_pos, col_pos = divmod(i, 3)
                 
                 m_item_short = None
                 m_price = None
@@ -316,7 +487,7 @@ class ExcelBuilder:
                     
                     # Look up the pre-generated ShortName for this modifier item
                     m_item_short = self.name_generator.lookup_shortname(m_raw, "item")
-                    m_price = "FORMULA_PRICE"
+                    m_price = _FORMULA
                     m_price_method = "Item Price"
                 
                 if i == 0:
@@ -336,39 +507,29 @@ class ExcelBuilder:
                         m_price, row_pos, col_pos, m_price_method
                     ])
 
-    def _assign_modifier_groups_to_items(self, json_data: dict):
+    def _modifier_group_columns(self, item: dict):
         """
-        Phase 3: Go back to Item data and fill columns I-R with modifier group ShortNames.
+        ShortNames for an item's columns I-R.
         Only assigns modifiers that exist in our modifier group data.
         """
-        for item in json_data.get("items", []):
-            raw_name = item.get("name") or ""
-            if raw_name not in self._item_indices:
+        filtered_modifiers = []
+        for mod in item.get("modifiers") or []:
+            if not mod:
                 continue
             
-            item_idx = self._item_indices[raw_name]
-            modifiers = item.get("modifiers") or []
+            # Look up the ShortName for this modifier group
+            mod_short = self.name_generator.lookup_shortname(mod, "modifier_group")
             
-            # Filter and convert modifiers to their ShortNames
-            filtered_modifiers = []
-            for mod in modifiers:
-                if not mod:
-                    continue
-                
-                # Look up the ShortName for this modifier group
-                mod_short = self.name_generator.lookup_shortname(mod, "modifier_group")
-                
-                # Only include if it exists in our modifier group data
-                if mod_short in self._modifier_group_shortnames:
-                    filtered_modifiers.append(mod_short)
-            
-            # Update columns I-R (indices 8-17) in the item row
-            for i, mod_short in enumerate(filtered_modifiers[:10]):
-                self.data["Item"][item_idx][8 + i] = mod_short
+            # Only include if it exists in our modifier group data
+            if mod_short in self._modifier_group_shortnames:
+                filtered_modifiers.append(mod_short)
+                if len(filtered_modifiers) == 10:
+                    break  # Only ten ModifierGroup columns exist
+        return filtered_modifiers
 
     def _create_submenus(self, json_data: dict):
         """
-        Phase 4: Create Submenu and SubmenuItem entries.
+        Phase 3: Create Submenu and SubmenuItem entries.
         SubmenuItem references use pre-generated ShortNames.
         """
         for sm in json_data.get("submenus", []):
@@ -377,8 +538,7 @@ class ExcelBuilder:
                 continue
             
             # Use pre-generated ShortName for submenu
-            sm_short = self.name_generator.lookup_shortname(raw_name, "submenu")
-            sm_long = self.name_generator.full_to_long.get(raw_name, raw_name[:23])
+            sm_short, sm_long = self._names_for(raw_name)
             
             self.data["Submenu"].append([
                 sm.get("number"),
@@ -388,8 +548,7 @@ class ExcelBuilder:
             
             # Create SubmenuItem entries
             for idx, item_name in enumerate(sm.get("items", [])):
-                row_pos = idx // 3
-                col_pos = idx % 3
+                row_pos, col_pos = divmod(idx, 3)
                 
                 # Look up the Item's ShortName (not the raw name from AI)
                 item_short = self.name_generator.lookup_shortname(item_name, "item")
@@ -401,7 +560,7 @@ class ExcelBuilder:
                     "Item Price",
                     row_pos,
                     col_pos,
-                    "FORMULA_PRICE"
+                    _FORMULA
                 ])
 
     def update_instructions_tab(self, wb):
@@ -412,69 +571,36 @@ class ExcelBuilder:
         ws.delete_rows(7, 5)
 
         # 2. Add items 3-5 to IMPORTANT INSTRUCTIONS section
-        ws.insert_rows(7, 3)
-        ws.cell(row=7, column=1, value="3. All dropdowns are protected - select from the list only.")
-        ws.cell(row=8, column=1, value="4. Fields left blank will be auto-generated based on database defaults.")
-        ws.cell(row=9, column=1, value="5. Right-click row number -> Insert to add rows in ModifierGroup_Items.")
+        ws.insert_rows(7, len(self._EXTRA_INSTRUCTION_LINES))
+        for row, line in enumerate(self._EXTRA_INSTRUCTION_LINES, start=7):
+            ws.cell(row=row, column=1, value=line)
 
         # 2. FORMATTING
         for r in [21, 27, 31]:
              for cell in ws[r]:
-                 if cell.value: cell.font = Font(bold=False)
+                 if cell.value: cell.font = _PLAIN_FONT
 
-        if ws["A26"].value: ws["A26"].font = Font(bold=True)
+        if ws["A26"].value: ws["A26"].font = _BOLD_FONT
 
         ws["A31"].value = "5. Menu"
-        ws["A31"].font = Font(bold=False)
+        ws["A31"].font = _PLAIN_FONT
 
         # 3. Clean Content ("TIPS")
-        target_row = None
-        target_col = None
-        tips_content = ""
-
-        for row in ws.iter_rows():
-            for cell in row:
-                if cell.value and isinstance(cell.value, str) and "TIPS" in cell.value:
-                    target_row = cell.row
-                    target_col = cell.column
-                    tips_content = cell.value
-                    cell.value = cell.value.replace("TIPS", "").strip()
-                    break
-            if target_row: break
-
-        if target_row:
-             ws.cell(row=target_row-1, column=target_col, value="NOTE: To edit structure (Headers), go to Review > Unprotect Sheet.")
-
-             parts = tips_content.split("TIPS")
-
-             button_expl_lines = [
-                parts[0].strip(),
-                "",
-                "BUTTON POSITION LOGIC:",
-                "1. MenuSubmenu (ButtonPositionIndex):",
-                "   - Sequential number (0, 1, 2...) determining sort order.",
-                "",
-                "2. SubmenuItem & ModifierGroup_Items (Row/Column):",
-                "   - Layout: 3 Columns x 7 Rows per page.",
-                "   - Rows: Start at 0 and ascend.",
-                "   - Logic: Row = Index // 3, Column = Index % 3.",
-                "",
-                "NOTE: Ensure no duplicate position combinations within the same Group.",
-                "",
-                "MODIFIER GROUPS:",
-                " - First Row: Enter Group Number, ShortName, LongName, AND First Item.",
-                " - D,E,F,G (Min/Max/Free/FlowRequired): Only for group header rows.",
-                " - Rows Below: Leave A-C BLANK. Enter Items in Cols I-M.",
-                " - To Add More Items: Right Click Row Number -> Insert."
-             ]
-
-             if ws.max_row >= target_row:
-                 pass
-
-             for i, line in enumerate(button_expl_lines):
-                 cell = ws.cell(row=target_row + i, column=target_col, value=line)
-                 if "BUTTON POSITION LOGIC:" in line or "MODIFIER GROUPS:" in line:
-                     cell.font = Font(bold=True)
+        # Scan plain values; text sits in columns A-C, so the search is not limited to A
+        tips = next(((r, c, val)
+                     for r, row in enumerate(ws.iter_rows(values_only=True), start=1)
+                     for c, val in enumerate(row, start=1)
+                     if isinstance(val, str) and "TIPS" in val), None)
+        if tips is not None:
+            target_row, target_col, tips_content = tips
+            ws.cell(row=target_row-1, column=target_col, value="NOTE: To edit structure (Headers), go to Review > Unprotect Sheet.")
+
+            # Keep only the text before "TIPS"; the explanation lines below replace the rest
+            ws.cell(row=target_row, column=target_col, value=tips_content.split("TIPS")[0].strip())
+            for i, line in enumerate(self._BUTTON_EXPL_LINES, start=1):
+                cell = ws.cell(row=target_row + i, column=target_col, value=line)
+                if line in self._BOLD_LINE_MARKERS:
+                    cell.font = _BOLD_FONT
 
     def get_template_path(self):
         filename = "Aloha_Import_Template_Generated.xlsx"
@@ -487,14 +613,18 @@ class ExcelBuilder:
         if os.path.exists(filename): return filename
         return filename
 
-    def build_final(self, is_empty_template=False) -> bytes:
+    def build_final(self, is_empty_template=False, out: Optional[BinaryIO] = None) -> Optional[bytes]:
+        """
+        Build the workbook. Returns the xlsx bytes, or writes them to `out`
+        (any writable binary file object) and returns None.
+        """
         template_path = self.get_template_path()
-        wb = openpyxl.load_workbook(template_path)
+        # The template's only formulas are placeholder rows that get deleted below,
+        # and it carries no external links, so skip parsing both
+        template_bytes = _read_template(template_path, os.path.getmtime(template_path))
+        wb = openpyxl.load_workbook(io.BytesIO(template_bytes), data_only=True, keep_links=False)
         self.update_instructions_tab(wb)
 
-        def get_list_formula(sheet, col_range):
-            return f"{quote_sheetname(sheet)}!{col_range}"
-
         target_sheets = ["Item", "Submenu", "SubmenuItem", "ModifierGroup_Items", "Menu", "Category", "TaxGroup", "MenuSubmenu"]
 
         guide_notes = {
@@ -508,29 +638,25 @@ class ExcelBuilder:
             ws = wb[sheet_name]
 
             # 1. Clear Existing Data (Keep Header Row 1)
-            if ws.max_row > 1:
-                ws.delete_rows(2, amount=ws.max_row - 1)
+            _clear_below_header(ws)
 
             # 2. Add Guide Notes (Only to Empty Template)
             if is_empty_template:
                  notes = guide_notes.get(sheet_name)
                  if notes:
                      ws.append(notes)
-                     for cell in ws[2]: cell.font = Font(italic=True)
+                     for cell in ws[2]: cell.font = _GUIDE_FONT
 
             # 3. Handle Special Columns
             if sheet_name == "Category":
-                owner_col = None
-                for cell in ws[1]:
-                     if cell.value == "OwnerName":
-                         owner_col = cell.column
-                         break
-                if owner_col: ws.delete_cols(owner_col)
+                headers = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+                if "OwnerName" in headers:
+                    ws.delete_cols(headers.index("OwnerName") + 1)
 
             if sheet_name == "SubmenuItem":
                 header_cell = ws.cell(row=1, column=7, value="Price")
                 ref_cell = ws.cell(row=1, column=6)
-                header_cell.font = Font(name='Cambria', size=11, bold=True)
+                header_cell.font = _HEADER_FONT
                 if ref_cell.fill:
                     header_cell.fill = ref_cell.fill.copy()
                 if ref_cell.alignment:
@@ -539,32 +665,33 @@ class ExcelBuilder:
                     header_cell.border = ref_cell.border.copy()
 
             # 4. Insert Data (if not empty)
-            if not is_empty_template:
+            if not is_empty_template and sheet_name not in self._EMPTY_DATA_SHEETS:
                 rows = self.data.get(sheet_name, [])
-                if sheet_name in ["Category", "TaxGroup", "MenuSubmenu"]:
-                    rows = []
-
+                clean_mask = self._CLEAN_COLUMNS.get(sheet_name)
+                price_col, item_col = self._PRICE_FORMULA_COLUMNS.get(sheet_name, (None, None))
+                prev_group_number = None
                 for idx, row_data in enumerate(rows):
                     curr_row = idx + 2
 
-                    if sheet_name == "ModifierGroup_Items":
-                        if len(row_data) > 9 and row_data[9] == "FORMULA_PRICE":
-                             row_data[9] = f"=IFERROR(VLOOKUP(I{curr_row}, Item!$B:$E, 4, FALSE), 0.00)"
-
-                    elif sheet_name == "SubmenuItem":
-                         if len(row_data) > 6 and row_data[6] == "FORMULA_PRICE":
-                             row_data[6] = f"=IFERROR(VLOOKUP(C{curr_row}, Item!$B:$E, 4, FALSE), 0.00)"
+                    # Build a fresh row so self.data keeps its placeholders
+                    mask = clean_mask if clean_mask and len(clean_mask) == len(row_data) else itertools.repeat(True)
+                    clean_row = [self.clean_text(val) if wanted and isinstance(val, str) else val
+                                 for val, wanted in zip(row_data, mask)]
 
-                    clean_row = []
-                    for val in row_data:
-                         if isinstance(val, str) and not val.startswith("="):
-                             val = self.clean_text(val)
-                         clean_row.append(val)
+                    if price_col is not None and len(clean_row) > price_col and clean_row[price_col] is _FORMULA:
+                        clean_row[price_col] = f"=IFERROR(VLOOKUP({item_col}{curr_row}, Item!$B:$E, 4, FALSE), 0.00)"
 
                     ws.append(clean_row)
 
-                    if sheet_name == "ModifierGroup_Items" and clean_row[0] and "Right Click" in str(clean_row[0]):
-                         ws.cell(row=curr_row, column=1).font = Font(italic=True, size=9)
+                    if sheet_name == "ModifierGroup_Items":
+                        # Column A normally holds group numbers; test the type rather than str() every one
+                        if isinstance(clean_row[0], str) and "Right Click" in clean_row[0]:
+                            ws.cell(row=curr_row, column=1).font = _NOTE_FONT
+
+                        # First item row under a group header gets the insert-rows hint
+                        if clean_row[0] is None and prev_group_number is not None and clean_row[7] is not None:
+                            ws.cell(row=curr_row, column=1).comment = Comment("Right Click Number to Insert Rows", "System")
+                        prev_group_number = clean_row[0]
 
             # 5. Protection (Robust Setup)
             ws.protection.sheet = False
@@ -585,133 +712,43 @@ class ExcelBuilder:
                 selectUnlockedCells=False
             )
 
-            max_r = 5000
-            for row in ws.iter_rows(min_row=2, max_row=max_r, max_col=30):
+            # Validations reach well past the data so rows added in Excel are still checked;
+            # the blank template has no data to size from
+            max_r = self._TEMPLATE_VALIDATION_ROWS if is_empty_template else ws.max_row + self._VALIDATION_BUFFER_ROWS
+            # Unlock everything below the header. Empty cells take their lock state from the
+            # column style, so only the cells that actually exist need unlocking one by one.
+            for dim in ws.column_dimensions.values():
+                dim.protection = _UNLOCKED
+            for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
                 for cell in row:
-                    cell.protection = Protection(locked=False)
+                    cell.protection = _UNLOCKED
 
             # 6. Validations (STRICT)
-            def add_strict_list(ws, formula, cell_range):
-                dv = DataValidation(type="list", formula1=formula, allow_blank=True)
-                dv.error = "Select from dropdown."
-                dv.errorTitle = "Invalid Selection"
-                dv.showErrorMessage = True
-                ws.add_data_validation(dv)
-                dv.add(cell_range)
-
-            if sheet_name == "Item":
-               add_strict_list(ws, get_list_formula('Category', '$B$2:$B$500'), f"H2:H{max_r}")
-               add_strict_list(ws, get_list_formula('TaxGroup', '$B$2:$B$500'), f"G2:G{max_r}")
-               add_strict_list(ws, get_list_formula('ModifierGroup_Items', '$B$2:$B$200'), f"I2:R{max_r}")
-
-               dv_type = DataValidation(type="list", formula1='"Standard,Gift Card"', allow_blank=True)
-               dv_type.showErrorMessage = True
-               dv_type.error = "Select from dropdown."
-               dv_type.errorTitle = "Invalid Selection"
-               ws.add_data_validation(dv_type)
-               dv_type.add(f"D2:D{max_r}")
-
-               dv_pm = DataValidation(type="list", formula1='"Item Price,Price Level,Quantity Price,Ask For Price"', allow_blank=True)
-               dv_pm.showErrorMessage = True
-               dv_pm.error = "Select from dropdown."
-               dv_pm.errorTitle = "Invalid Selection"
-               ws.add_data_validation(dv_pm)
-               dv_pm.add(f"F2:F{max_r}")
-
-            elif sheet_name == "Category":
-                dv_type = DataValidation(type="list", formula1='"General,Sales,Retail"', allow_blank=True)
-                dv_type.showErrorMessage = True
-                dv_type.error = "Select from dropdown."
-                dv_type.errorTitle = "Invalid Selection"
-                ws.add_data_validation(dv_type)
-                dv_type.add(f"C2:C{max_r}")
-
-            elif sheet_name == "ModifierGroup_Items":
-                add_strict_list(ws, get_list_formula('Item', '$B$2:$B$2000'), f"I2:I{max_r}")
-
-                dv_pm = DataValidation(type="list", formula1='"Item Price,Button Price"', allow_blank=True)
-                dv_pm.showErrorMessage = True
-                ws.add_data_validation(dv_pm)
-                dv_pm.add(f"M2:M{max_r}")
-
-                dv_price = DataValidation(type="custom", formula1='=M2<>"Item Price"')
-                dv_price.error = "Price is linked to Item Default. Change Method to edit."
-                dv_price.showErrorMessage = True
-                ws.add_data_validation(dv_price)
-                dv_price.add(f"J2:J{max_r}")
-
-                dv_flow = DataValidation(type="list", formula1='"Yes,No"', allow_blank=True)
-                dv_flow.showErrorMessage = True
-                dv_flow.error = "Select from dropdown."
-                dv_flow.errorTitle = "Invalid Selection"
-                ws.add_data_validation(dv_flow)
-                dv_flow.add(f"G2:G{max_r}")
-
-                dv_nums = DataValidation(
-                    type="custom",
-                    formula1='=OR(ISBLANK($A2), AND(NOT(ISBLANK($A2)), NOT(ISBLANK($B2)), NOT(ISBLANK($C2))))'
-                )
-                dv_nums.errorTitle = "Group Row Required"
-                dv_nums.error = "These fields are only for rows with Number, ShortName, and LongName filled in."
-                dv_nums.showErrorMessage = True
-                ws.add_data_validation(dv_nums)
-                dv_nums.add(f"D2:F{max_r}")
-
-                dv_lock = DataValidation(type="custom", formula1='=ISBLANK($I2)')
-                dv_lock.error = "Number, ShortName, LongName must be blank for item rows (where ItemName is filled)."
-                dv_lock.showErrorMessage = True
-                ws.add_data_validation(dv_lock)
-                dv_lock.add(f"A2:C{max_r}")
-
-            elif sheet_name == "SubmenuItem":
-                add_strict_list(ws, get_list_formula('Submenu', '$B$2:$B$500'), f"A2:A{max_r}")
-                add_strict_list(ws, get_list_formula('Item', '$B$2:$B$2000'), f"C2:C{max_r}")
-
-                dv_type = DataValidation(type="list", formula1='"Item Button,PLU Button"', allow_blank=True)
-                dv_type.showErrorMessage = True
-                dv_type.error = "Select from dropdown."
-                dv_type.errorTitle = "Invalid Selection"
-                ws.add_data_validation(dv_type)
-                dv_type.add(f"B2:B{max_r}")
-
-                dv_pm = DataValidation(type="list", formula1='"Item Price,Button Price,Price Level"', allow_blank=True)
-                dv_pm.showErrorMessage = True
-                dv_pm.error = "Select from dropdown."
-                dv_pm.errorTitle = "Invalid Selection"
-                ws.add_data_validation(dv_pm)
-                dv_pm.add(f"D2:D{max_r}")
-
-                dv_p = DataValidation(type="custom", formula1='=D2<>"Item Price"')
-                dv_p.error = "Price is linked to Item Default."
-                dv_p.showErrorMessage = True
-                ws.add_data_validation(dv_p)
-                dv_p.add(f"G2:G{max_r}")
-
-            elif sheet_name == "MenuSubmenu":
-                add_strict_list(ws, get_list_formula('Menu', '$B$2:$B$100'), f"A2:A{max_r}")
-                add_strict_list(ws, get_list_formula('Submenu', '$B$2:$B$500'), f"B2:B{max_r}")
-
-        # Apply Comment Logic for ModifierGroup_Items
-        if "ModifierGroup_Items" in wb.sheetnames:
-            ws = wb["ModifierGroup_Items"]
-            for row_idx in range(2, ws.max_row + 1):
-                if row_idx > 2:
-                    current_cell_A = ws.cell(row=row_idx, column=1)
-                    prev_cell_A = ws.cell(row=row_idx - 1, column=1)
-                    current_cell_H = ws.cell(row=row_idx, column=8)
-
-                    if current_cell_A.value is None and prev_cell_A.value is not None and current_cell_H.value is not None:
-                        current_cell_A.comment = Comment("Right Click Number to Insert Rows", "System")
-
+            validations = self._VALIDATIONS.get(sheet_name, ())
+            if validations:
+                # The template already carries older copies of these same rules (ranges to rows
+                # 1002 and 5000); replace them so each rule exists once with the sized range
+                ws.data_validations.dataValidation = []
+            for cols, dv_type, formula, allow_blank, error_title, error in validations:
+                first_col, last_col = cols
+                ws.add_data_validation(DataValidation(
+                    type=dv_type, formula1=formula, allow_blank=allow_blank,
+                    error=error, errorTitle=error_title, showErrorMessage=True,
+                    sqref=f"{first_col}2:{last_col}{max_r}",
+                ))
+
+        if out is not None:
+            wb.save(out)
+            return None
         output = io.BytesIO()
         wb.save(output)
         return output.getvalue()
 
-    def build_excel(self) -> bytes:
-        return self.build_final(is_empty_template=False)
+    def build_excel(self, out: Optional[BinaryIO] = None) -> Optional[bytes]:
+        return self.build_final(is_empty_template=False, out=out)
 
-    def build_empty_template(self) -> bytes:
-        return self.build_final(is_empty_template=True)
+    def build_empty_template(self, out: Optional[BinaryIO] = None) -> Optional[bytes]:
+        return self.build_final(is_empty_template=True, out=out)
 
 if __name__ == "__main__":
     print("Testing Consolidated Builder...")
@@ -730,13 +767,11 @@ if __name__ == "__main__":
     }
     builder.add_data(dummy_data)
 
-    data = builder.build_excel()
     with open("Aloha_Import_Template_Consolidated.xlsx", "wb") as f:
-        f.write(data)
+        builder.build_excel(out=f)
     print("Success! Created 'Aloha_Import_Template_Consolidated.xlsx'.")
 
-    empty_data = builder.build_empty_template()
     with open("Aloha_Import_Template_Consolidated_Empty.xlsx", "wb") as f:
-        f.write(empty_data)
+        builder.build_empty_template(out=f)
     print("Success! Created 'Aloha_Import_Template_Consolidated_Empty.xlsx'.")
 
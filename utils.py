@@ -1,26 +1,52 @@
-import os
-import tempfile
+import io
+from pypdf import PdfReader, PdfWriter
+from PIL import Image, ImageOps
 
-def save_uploaded_file(uploaded_file):
+def split_pdf_pages(data, max_parts=None):
     """
-    Saves a specific uploaded file to a temporary location.
-    Returns the absolute path to the saved file.
+    Split a PDF (given as bytes) into single-page PDFs.
+    If max_parts is given, consecutive pages are grouped so that at most
+    max_parts PDFs are produced (e.g. one per request the rate limit allows).
+    Returns the list of PDFs as bytes, in page order (empty list on failure).
     """
+    parts = []
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            return tmp_file.name
+        pages = PdfReader(io.BytesIO(data)).pages
+        per_part = 1
+        if max_parts:
+            per_part = max(1, -(-len(pages) // max_parts))
+        for start in range(0, len(pages), per_part):
+            writer = PdfWriter()
+            for page in pages[start:start + per_part]:
+                writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            parts.append(buffer.getvalue())
     except Exception as e:
-        print(f"Error saving file: {e}")
-        return None
+        print(f"Error splitting PDF: {e}")
+        return []
+    return parts
 
-def cleanup_temp_file(file_path):
-    """Remove temporary file"""
-    if file_path and os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-        except Exception:
-             pass
+def downscale_image(data, max_side=2048):
+    """
+    Shrink a menu photo (given as bytes) for upload: longest edge capped at
+    `max_side`, grayscale, JPEG quality 85. Printed menus read just as well
+    and the request is a fraction of the size.
+    Returns the JPEG as bytes, or None on failure.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # Phone photos store rotation in EXIF, which the re-encode drops
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            if img.mode != "L":
+                img = img.convert("L")
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=85, optimize=True)
+            return buffer.getvalue()
+    except Exception as e:
+        print(f"Error downscaling image: {e}")
+        return None
 
 import requests
 from bs4 import BeautifulSoup
@@ -84,3 +110,40 @@ def scrape_url(url: str) -> str:
         print(f"Scraping error: {e}")
         return f"Error scraping URL: {str(e)}"
 
+def _is_heading(line: str) -> bool:
+    # Section titles in scraped menus are short and carry no prices
+    line = line.strip()
+    return 0 < len(line) <= 40 and not any(ch.isdigit() for ch in line)
+
+def chunk_by_headings(text: str, max_chars: int = 8000) -> list:
+    """
+    Split scraped menu text into chunks of roughly `max_chars` or less
+    (~2k tokens), breaking before heading-like lines where possible so a
+    menu section stays in one chunk. The data blocks scrape_url appends
+    ("--- JSON-LD DATA ---" etc.) always start a new chunk.
+    Returns the list of chunks (the whole text if it fits in one).
+    """
+    chunks = []
+    current = []
+    size = 0
+    last_heading = 0  # index in `current` to cut at; 0 means no heading seen
+
+    for line in text.split("\n"):
+        if line.startswith("--- ") and line.endswith(" ---"):
+            chunks.append("\n".join(current))
+            current, size, last_heading = [], 0, 0
+
+        while current and size + len(line) > max_chars:
+            cut = last_heading or len(current)
+            chunks.append("\n".join(current[:cut]))
+            current = current[cut:]
+            size = sum(len(l) + 1 for l in current)
+            last_heading = 0
+
+        if current and _is_heading(line):
+            last_heading = len(current)
+        current.append(line)
+        size += len(line) + 1
+
+    chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()] or [text]